@@ -12,12 +12,26 @@ __author__ = "James Gaboardi <jgaboardi@gmail.com>"
 
 import geopandas
 import matplotlib
+import numpy
+import pandas
+import shapely
 import string
-from shapely.geometry import Point, Polygon
 import sys
 
-def nd_intersects(pnts, pgons, ptid, pgid, keep_columns):
+# Supported spatial join methods
+_HOWS = ["left", "right", "inner"]
+
+# Point-in-polygon x/y predicates evaluated as ``func(polygon, x, y)``,
+# keyed by the equivalent point-on-left binary predicate
+_XY_PREDICATES = {"intersects": shapely.intersects_xy, "within": shapely.contains_xy}
+
+
+def nd_intersects(pnts, pgons, ptid, pgid, keep_columns, tree=None):
     """Create a non-duplicated intersects geodataframe.
+
+    Each row of ``pnts`` yields exactly one row, aligned to ``pnts.index``.
+    The IDs of all polygons it intersects are joined with "-" in polygon
+    row order, and points intersecting no polygon are given "NaN".
     
     Parameters
     ----------
@@ -25,41 +39,49 @@ def nd_intersects(pnts, pgons, ptid, pgid, keep_columns):
         Points for spatial join.
     pgons : geopandas.GeoDataFrame
         Polygons for spatial join.
-    how : str
-        Type of join to perform.
     ptid : str
-        Point ID variable.
+        Point ID variable. Kept for API compatibility only -- rows are
+        squashed per point, not per point ID value.
     pgid : str
         Polygon ID variable.
     keep_columns : list
         Columns to retain.
+    tree : {shapely.STRtree, geopandas.sindex.SpatialIndex}
+        Prebuilt spatial index of ``pgons`` geometries. Default is None, which
+        uses ``pgons.sindex``.
     
     Returns
     -------
     ndgdf : geopandas.GeoDataFrame
-        Result of the non-duplicated intersects method.
+        Result of the non-duplicated intersects method, one row per point.
     """
 
-    def _row(_p, _g):
-        """generate specific row values for dataframe"""
-        return (_p, "-".join(_g[pgid]), *_g.geometry.unique())
-
     if pnts.geometry.name not in keep_columns:
         keep_columns += [pnts.geometry.name]
 
-    # perform "intersects" spatial join
-    igdf = do_sjoin(pnts, pgons, "intersects", ptid, pgid, keep_columns)
+    # perform "intersects" spatial join -- positional indexers only
+    l, r = _do_sjoin_indices(pnts, pgons, "intersects", tree=tree)
+    l, r = _left_indexers(l, r, len(pnts))
+    starts = numpy.unique(l, return_index=True)[1]
 
-    # Create shell dataframe to store squashed intersection points
-    ndgdf = geopandas.GeoDataFrame(columns=igdf.columns, index=pnts.index)
+    # Squash intersection points -- fuse polygon IDs ("NaN" for no polygon)
+    # (one linear-time join per contiguous group of the sorted indexers)
+    ids = numpy.append(pgons[pgid].to_numpy(dtype=object), "NaN")[r].tolist()
+    ends = numpy.r_[starts[1:], len(ids)].tolist()
+    fused = ["-".join(ids[s:e]) for s, e in zip(starts.tolist(), ends)]
 
-    # Populate the squashed intersection points dataframe
-    ndgdf.loc[:, keep_columns] = [_row(p, g) for p, g in igdf.groupby(ptid)]
+    # Build the squashed intersection points dataframe in one shot
+    geom = pnts.geometry.name
+    columns = {c: fused if c == pgid else pnts[c].values for c in keep_columns}
+    kws = {"index": pnts.index, "geometry": geom, "crs": pnts.crs}
+    ndgdf = geopandas.GeoDataFrame(columns, **kws)
 
     return ndgdf
 
 
-def do_sjoin(df1, df2, op, ptid, pgid, keep_columns, how="left", fillna="NaN"):
+def do_sjoin(
+    df1, df2, op, ptid, pgid, keep_columns, how="left", fillna="NaN", tree=None
+):
     """Perform a spatial join in GeoPandas.
     
     Parameters
@@ -81,6 +103,9 @@ def do_sjoin(df1, df2, op, ptid, pgid, keep_columns, how="left", fillna="NaN"):
         Join method. Defaults is 'left'. Also supports {'right', 'inner'}.
     fillna : {None, bool, int, str, ...}
         Any value to fill 'not a value' cells. Defaults is 'NaN'.
+    tree : {shapely.STRtree, geopandas.sindex.SpatialIndex}
+        Prebuilt spatial index of ``df2`` geometries. Default is None, which
+        uses (and caches) ``df2.sindex`` for repeated joins against ``df2``.
     
     Returns
     -------
@@ -88,19 +113,119 @@ def do_sjoin(df1, df2, op, ptid, pgid, keep_columns, how="left", fillna="NaN"):
         Result of the spatial join.
     """
 
+    # Validate join method before any spatial work
+    if how not in _HOWS:
+        msg = "`how` was \"%s\" but is expected to be in %s" % (how, _HOWS)
+        raise ValueError(msg)
+
     # Make sure to keep geometry (from left dataframe)
     if df1.geometry.name not in keep_columns:
         keep_columns += [df1.geometry.name]
 
     # Perform join
-    df3 = geopandas.sjoin(df1, df2, how=how, op=op)[keep_columns]
+    l, r = _do_sjoin_indices(df1, df2, op, tree=tree)
+    df3 = _frame_join(df1, df2, l, r, how)[keep_columns]
 
     # Fill actual NaN with "NaN" for plotting purposes
-    df3.loc[(df3[pgid].isna()), pgid] = fillna
+    missing = df3[pgid].isna()
+    if how != "inner" and missing.any():
+        # categorical IDs need the fill value registered as a category
+        categorical = isinstance(df3[pgid].dtype, pandas.CategoricalDtype)
+        # (a null fill is stored as NaN and needs no category)
+        if (
+            categorical
+            and pandas.notna(fillna)
+            and fillna not in df3[pgid].cat.categories
+        ):
+            df3[pgid] = df3[pgid].cat.add_categories([fillna])
+        df3.loc[missing, pgid] = fillna
 
     return df3
 
 
+def _do_sjoin_indices(df1, df2, op, tree=None):
+    """positional (left, right) indexers of an inner spatial join"""
+
+    # query the right spatial index (built once & cached) with left geometries
+    prebuilt = tree is not None or df2.has_sindex
+    if tree is None:
+        tree = df2.sindex
+    if prebuilt and _disjoint_bounds(df1, df2):
+        # no query needed when the extents of a prebuilt index do not overlap
+        l = r = numpy.array([], dtype=numpy.intp)
+    elif op in _XY_PREDICATES and (df1.geom_type == "Point").all():
+        l, r = _query_points(df1, df2, op, tree)
+    else:
+        l, r = tree.query(df1.geometry.values, predicate=op)
+
+    return l, r
+
+
+def _disjoint_bounds(df1, df2):
+    """determine whether the total bounds of two dataframes are disjoint"""
+    lb, rb = df1.total_bounds, df2.total_bounds
+    return lb[2] < rb[0] or lb[0] > rb[2] or lb[3] < rb[1] or lb[1] > rb[3]
+
+
+def _query_points(df1, df2, op, tree):
+    """point-in-polygon join on x/y coordinates of bounding box candidates"""
+
+    # bounding box candidates
+    l, r = tree.query(df1.geometry.values)
+
+    # prepare candidate right geometries (in place, so kept for later joins)
+    geoms = numpy.asarray(df2.geometry.values)
+    shapely.prepare(geoms[numpy.unique(r)])
+
+    # test all candidate pairs in a single vectorized call
+    xs, ys = shapely.get_x(df1.geometry.values), shapely.get_y(df1.geometry.values)
+    hits = _XY_PREDICATES[op](geoms[r], xs[l], ys[l])
+
+    return l[hits], r[hits]
+
+
+def _left_indexers(l, r, n):
+    """add unmatched left rows to sorted indexers (as a right row of -1)"""
+
+    missing = numpy.setdiff1d(numpy.arange(n), l)
+    l = numpy.concatenate([l, missing])
+    r = numpy.concatenate([r, numpy.full(len(missing), -1, dtype=r.dtype)])
+
+    # order of the left dataframe, then of the right
+    order = numpy.lexsort((r, l))
+
+    return l[order], r[order]
+
+
+def _frame_join(df1, df2, l, r, how, lsuffix="left", rsuffix="right"):
+    """assemble joined dataframe from positional left/right indexers"""
+
+    if how == "right":
+        # mirror a left join so the right index & geometry are retained
+        return _frame_join(df2, df1, r, l, "left", rsuffix, lsuffix)
+
+    if how == "left":
+        l, r = _left_indexers(l, r, len(df1))
+    elif how == "inner":
+        # restore the order of the left dataframe, then of the right
+        order = numpy.lexsort((r, l))
+        l, r = l[order], r[order]
+    else:
+        msg = "`how` was \"%s\" but is expected to be in %s" % (how, _HOWS)
+        raise ValueError(msg)
+
+    left = df1.take(l)
+    right = df2.drop(columns=df2.geometry.name).reset_index(drop=True).reindex(r)
+    right.index = left.index
+
+    # suffix overlapping column names as in `geopandas.sjoin`
+    overlap = left.columns.intersection(right.columns)
+    left = left.rename(columns={c: "%s_%s" % (c, lsuffix) for c in overlap})
+    right = right.rename(columns={c: "%s_%s" % (c, rsuffix) for c in overlap})
+
+    return pandas.concat([left, right], axis=1)
+
+
 def demo_plot_join(
     pnts, pgons, ptid, pgid, title, orig, save=None, cmap="Paired", fmat="png"
 ):
@@ -133,27 +258,18 @@ def demo_plot_join(
 
     def pgon_labels(p):
         """label polygons"""
-
-        def _loc(_x):
-            """polygon label location helper"""
-            return [coord + 0.35 for coord in _x.geometry.centroid.coords[0]]
-
+        xy = shapely.get_coordinates(shapely.centroid(p.geometry.values)) + 0.35
         kws = {"size": 25, "va": "bottom"}
-        p.apply(lambda x: base.annotate(s=x[pgid], xy=_loc(x), **kws), axis=1)
+        for lab, loc in zip(p[pgid].to_numpy(), xy):
+            base.annotate(lab, xy=loc, **kws)
 
     def pt_labels(p):
         """label points with PTID+PGID"""
-
-        def _lab(_x):
-            """point label helper"""
-            return ",".join([_x[ptid], _x[pgid]])
-
-        def _loc(_x):
-            """point label location helper"""
-            return _x.geometry.coords[0]
-
+        labs = (p[ptid].astype(str) + "," + p[pgid].astype(str)).to_numpy()
+        xy = shapely.get_coordinates(p.geometry.values)
         kws = {"size": 15, "va": "bottom", "weight": "bold"}
-        p.apply(lambda x: base.annotate(s=_lab(x), xy=_loc(x), **kws), axis=1)
+        for lab, loc in zip(labs, xy):
+            base.annotate(lab, xy=loc, **kws)
 
     def add_title(label, sup=True):
         """add a suptitle or title"""
@@ -203,8 +319,11 @@ def demo_points(ptid):
         (0, 0),
         (0.5, 0.5),
     ]
-    point_ids = {ptid: list(string.ascii_uppercase[: len(point_coords)])}
-    points = [Point(coords) for coords in point_coords]
+    n = len(point_coords)
+    point_ids = list(string.ascii_uppercase[:n])
+    point_ids = {ptid: pandas.Categorical.from_codes(numpy.arange(n), point_ids)}
+    points = shapely.points(numpy.asarray(point_coords, dtype=numpy.float64))
+    points = geopandas.array.from_shapely(points)
     points = geopandas.GeoDataFrame(point_ids, geometry=points)
     return points
 
@@ -216,9 +335,14 @@ def demo_polygons(pgid):
         [(0, -1), (1, -1), (1, 0), (0, 0)],
         [(-1, 0), (0, 0), (0, 1), (-1, 1)],
     ]
-    polygon_ids = {pgid: list(string.ascii_lowercase[-len(polygon_coords) :])}
-    polygons = [Polygon(coords) for coords in polygon_coords]
+    n = len(polygon_coords)
+    polygon_ids = list(string.ascii_lowercase[-n:])
+    polygon_ids = {pgid: pandas.Categorical.from_codes(numpy.arange(n), polygon_ids)}
+    polygons = shapely.polygons(numpy.asarray(polygon_coords, dtype=numpy.float64))
+    polygons = geopandas.array.from_shapely(polygons)
     polygons = geopandas.GeoDataFrame(polygon_ids, geometry=polygons)
+    # Build the spatial index up front -- reused by every join on polygons
+    polygons.sindex
     return polygons
 
 
@@ -0,0 +1,100 @@
+"""Regression tests comparing :mod:`nd_intersects` with ``geopandas.sjoin``"""
+
+import geopandas
+import numpy
+import pandas
+import pytest
+import shapely
+
+from nd_intersects import do_sjoin, nd_intersects
+
+PTID, PGID = "point_id", "polygon_id"
+OPS = ["intersects", "within", "contains", "touches"]
+HOWS = ["left", "inner", "right"]
+
+
+@pytest.fixture
+def points():
+    """points inside, on boundaries/vertices of, and outside the polygons"""
+    coords = [
+        (-0.5, -0.5),  # interior of "x"
+        (0, -0.5),  # shared edge of "x" & "y"
+        (0, 0),  # shared vertex of "x", "y" & "z"
+        (0.5, 0.5),  # no polygon
+        (-1, -1),  # outer vertex of "x"
+        (0.5, -0.75),  # interior of "y"
+    ]
+    ids = list("ABCDEF")
+    gdf = geopandas.GeoDataFrame(
+        {PTID: ids, "name": ids}, geometry=shapely.points(coords)
+    )
+    # shuffled, non-default index
+    gdf.index = [40, 10, 30, 20, 60, 50]
+    return gdf.iloc[[3, 0, 5, 1, 4, 2]]
+
+
+@pytest.fixture
+def polygons():
+    """three unit squares sharing edges, with a shuffled index"""
+    coords = [
+        [(-1, -1), (0, -1), (0, 0), (-1, 0)],
+        [(0, -1), (1, -1), (1, 0), (0, 0)],
+        [(-1, 0), (0, 0), (0, 1), (-1, 1)],
+    ]
+    ids = list("xyz")
+    gdf = geopandas.GeoDataFrame(
+        {PGID: ids, "name": ids}, geometry=shapely.polygons(coords)
+    )
+    gdf.index = [7, 5, 9]
+    return gdf
+
+
+def _values(s):
+    """column values as a list with all missing values as None"""
+    return s.astype(object).where(s.notna(), None).tolist()
+
+
+def _keep_columns():
+    """point & polygon IDs plus the suffixed overlapping column"""
+    return [PTID, PGID, "name_left", "name_right"]
+
+
+@pytest.mark.parametrize("how", HOWS)
+@pytest.mark.parametrize("op", OPS)
+def test_do_sjoin_matches_sjoin(points, polygons, op, how):
+    observed = do_sjoin(points, polygons, op, PTID, PGID, _keep_columns(), how=how)
+
+    expected = geopandas.sjoin(points, polygons, how=how, predicate=op)
+    expected = expected[_keep_columns() + ["geometry"]]
+    if how != "inner":
+        expected[PGID] = expected[PGID].astype(object)
+        expected.loc[expected[PGID].isna(), PGID] = "NaN"
+
+    assert observed.index.tolist() == expected.index.tolist()
+    for column in _keep_columns():
+        assert _values(observed[column]) == _values(expected[column]), column
+    assert observed.geometry.geom_equals(expected.geometry).all()
+
+
+def test_do_sjoin_invalid_how(points, polygons):
+    with pytest.raises(ValueError, match="`how` was"):
+        do_sjoin(points, polygons, "intersects", PTID, PGID, [PTID], how="outer")
+
+
+def test_nd_intersects_matches_sjoin(points, polygons):
+    observed = nd_intersects(points, polygons, PTID, PGID, [PTID, PGID])
+
+    # squash a left "intersects" sjoin by point, in polygon row order
+    joined = geopandas.sjoin(points, polygons, how="left", predicate="intersects")
+    position = pandas.Series(numpy.arange(len(polygons)), index=polygons.index)
+    joined["order"] = joined["index_right"].map(position)
+    joined = joined.sort_values("order", kind="stable", na_position="last")
+    fused = joined[PGID].fillna("NaN").groupby(level=0, sort=False).agg("-".join)
+    expected = fused.reindex(points.index)
+
+    assert observed.index.tolist() == points.index.tolist()
+    assert observed[PTID].tolist() == points[PTID].tolist()
+    assert observed[PGID].tolist() == expected.tolist()
+    assert observed.geometry.geom_equals(points.geometry).all()
+    assert observed.loc[20, PGID] == "NaN"
+    assert observed.loc[30, PGID] == "x-y-z"